@@ -8,10 +8,53 @@ import streamlit as st
 from typing import Dict, List, Optional, Tuple
 from zipfile import ZipFile
 from io import BytesIO
-from pygments import highlight
-from pygments.lexers import get_lexer_for_filename, TextLexer
-from pygments.formatters import HtmlFormatter
+from functools import lru_cache
 import mimetypes
+from src.utils.helpers import count_lines
+
+# Pygments viene importato solo al primo highlighting: l'interfaccia usa
+# st.code e la maggior parte delle sessioni non ne ha mai bisogno
+
+@lru_cache(maxsize=1)
+def _get_formatter():
+    """
+    Restituisce l'HtmlFormatter condiviso: la configurazione è costante.
+    
+    Returns:
+        HtmlFormatter: Formatter per l'highlighting HTML
+    """
+    from pygments.formatters import HtmlFormatter
+    return HtmlFormatter(
+        style='monokai',
+        linenos=True,
+        cssclass='source'
+    )
+
+@lru_cache(maxsize=64)
+def _get_lexer(language: str):
+    """
+    Restituisce il lexer Pygments per un linguaggio, risolto una sola volta.
+    
+    L'app passa sia estensioni ('py', 'yml', 'txt') sia nomi di lexer
+    ('python'): prima si prova l'alias, poi la risoluzione per nome file
+    usata in origine, così estensioni come 'yml' non finiscono su TextLexer.
+    
+    Args:
+        language: Nome, alias o estensione del linguaggio
+        
+    Returns:
+        Lexer: Lexer del linguaggio, TextLexer se sconosciuto
+    """
+    from pygments.lexers import get_lexer_by_name, get_lexer_for_filename, TextLexer
+    from pygments.util import ClassNotFound
+    try:
+        return get_lexer_by_name(language)
+    except ClassNotFound:
+        pass
+    try:
+        return get_lexer_for_filename(f"file.{language}")
+    except ClassNotFound:
+        return TextLexer()
 
 class FileManager:
     """Gestisce l'upload, il processing e il caching dei file."""
@@ -25,9 +68,29 @@ class FileManager:
     
     MAX_FILE_SIZE = 5 * 1024 * 1024  # 5MB
     
-    def __init__(self):
-        """Inizializza il FileManager."""
-        self.current_path = None
+    FILE_ICONS = {
+        '.py': '🐍',
+        '.js': '📜',
+        '.jsx': '⚛️',
+        '.ts': '📘',
+        '.tsx': '💠',
+        '.html': '🌐',
+        '.css': '🎨',
+        '.java': '☕',
+        '.cpp': '⚙️',
+        '.c': '🔧',
+        '.go': '🔵',
+        '.rs': '🦀',
+        '.rb': '💎',
+        '.php': '🐘',
+        '.sql': '🗄️',
+        '.md': '📝',
+        '.txt': '📄',
+        '.json': '📋',
+        '.yml': '⚙️',
+        '.yaml': '⚙️',
+        '.zip': '📦'
+    }
     
     def process_file(self, uploaded_file) -> Optional[Dict]:
         """
@@ -52,9 +115,10 @@ class FileManager:
         try:
             content = uploaded_file.read()
             if isinstance(content, bytes):
-                content = content.decode('utf-8')
+                content = FileManager._decode(content)
             
             # Determina il linguaggio
+            from pygments.lexers import get_lexer_for_filename
             try:
                 lexer = get_lexer_for_filename(uploaded_file.name)
                 language = lexer.name.lower()
@@ -92,6 +156,7 @@ class FileManager:
     @st.cache_data
     def _process_zip_cached(zip_file) -> Dict[str, Dict]:
         """Versione cacheable del process_zip."""
+        from pygments.lexers import get_lexer_for_filename
         processed_files = {}
         total_size = 0
         
@@ -110,7 +175,7 @@ class FileManager:
                     continue
                     
                 try:
-                    content = zip_ref.read(file_info.filename).decode('utf-8')
+                    content = FileManager._decode(zip_ref.read(file_info.filename))
                     try:
                         lexer = get_lexer_for_filename(file_info.filename)
                         language = lexer.name.lower()
@@ -137,7 +202,7 @@ class FileManager:
         return processed_files
     
     @staticmethod
-    @st.cache_data
+    @st.cache_data(max_entries=128, show_spinner=False)
     def _highlight_code_cached(content: str, language: str) -> str:
         """
         Versione cacheable del syntax highlighting.
@@ -149,20 +214,102 @@ class FileManager:
         Returns:
             str: HTML con syntax highlighting
         """
+        from pygments import highlight
+        return highlight(content, _get_lexer(language), _get_formatter())
+    
+    @staticmethod
+    def get_content(file_info: Dict) -> str:
+        """
+        Restituisce il contenuto testuale di un file caricato.
+        
+        I file caricati singolarmente conservano i byte originali, decodificati
+        una sola volta al primo accesso. I file estratti da uno ZIP non
+        conservano il contenuto decodificato: l'entry viene letta
+        dall'archivio in sessione solo quando richiesta. Il caricamento resta
+        così leggero; il testo completo viene comunque tenuto dalla cache del
+        contesto chat al primo messaggio (ChatInterface._get_context).
+        
+        Args:
+            file_info: Informazioni sul file caricato
+            
+        Returns:
+            str: Contenuto del file
+        """
+        if 'content' in file_info:
+            return file_info['content']
+        if file_info.get('binary'):
+            # Rilevato al caricamento: niente da decodificare
+            return ""
+        raw = file_info.pop('raw', None)
+        if raw is not None:
+            # Conserva solo il testo, senza tenere in memoria anche i byte
+            file_info['content'] = FileManager._decode(raw)
+            return file_info['content']
         try:
-            lexer = get_lexer_for_filename(f"file.{language}")
-        except:
-            lexer = TextLexer()
+            archive = st.session_state.zip_archives[file_info['archive']]
+            with archive.open(file_info['name']) as entry:
+                return FileManager._decode(entry.read())
+        except Exception:
+            # Entry non più leggibile: il file resta fuori dal contesto
+            # invece di far fallire l'invio del messaggio
+            return ""
+    
+    @staticmethod
+    def get_line_count(file_info: Dict) -> int:
+        """
+        Restituisce il numero di righe di un file caricato.
+        
+        Il conteggio avviene al primo accesso, insieme alla decodifica, e
+        resta poi nei metadati del file.
+        
+        Args:
+            file_info: Informazioni sul file caricato
             
-        formatter = HtmlFormatter(
-            style='monokai',
-            linenos=True,
-            cssclass='source'
-        )
+        Returns:
+            int: Numero di righe
+        """
+        if 'line_count' not in file_info:
+            file_info['line_count'] = count_lines(FileManager.get_content(file_info))
+        return file_info['line_count']
+    
+    @staticmethod
+    def _decode(raw: bytes) -> str:
+        """
+        Decodifica i byte di un file di testo.
+        
+        Un byte nullo nei primi 8KB indica un file binario: restituisce una
+        stringa vuota invece di passare al contesto LLM testo senza senso.
+        Il caso comune (UTF-8 valido) usa la decodifica stretta; solo i file
+        con byte non validi ripiegano su errors='replace'.
+        
+        Args:
+            raw: Byte del file
+            
+        Returns:
+            str: Testo decodificato
+        """
+        if FileManager.is_binary(raw):
+            return ""
+        try:
+            return raw.decode('utf-8')
+        except UnicodeDecodeError:
+            return raw.decode('utf-8', errors='replace')
+    
+    @staticmethod
+    def is_binary(head: bytes) -> bool:
+        """
+        Verifica se i byte iniziali di un file indicano un file binario.
         
-        return highlight(content, lexer, formatter)
+        Args:
+            head: Byte del file (bastano i primi 8KB)
+            
+        Returns:
+            bool: True se è presente un byte nullo nei primi 8KB
+        """
+        return b'\x00' in head[:8192]
     
-    def get_file_icon(self, filename: str) -> str:
+    @staticmethod
+    def get_file_icon(filename: str) -> str:
         """
         Restituisce un'icona appropriata per il tipo di file.
         
@@ -172,30 +319,10 @@ class FileManager:
         Returns:
             str: Emoji rappresentativa
         """
-        ext = os.path.splitext(filename)[1].lower()
-        icons = {
-            '.py': '🐍',
-            '.js': '📜',
-            '.jsx': '⚛️',
-            '.ts': '📘',
-            '.tsx': '💠',
-            '.html': '🌐',
-            '.css': '🎨',
-            '.java': '☕',
-            '.cpp': '⚙️',
-            '.c': '🔧',
-            '.go': '🔵',
-            '.rs': '🦀',
-            '.rb': '💎',
-            '.php': '🐘',
-            '.sql': '🗄️',
-            '.md': '📝',
-            '.txt': '📄',
-            '.json': '📋',
-            '.yml': '⚙️',
-            '.yaml': '⚙️'
-        }
-        return icons.get(ext, '📄')
+        if '.' not in filename:
+            return '📄'
+        ext = '.' + filename.rpartition('.')[2].lower()
+        return FileManager.FILE_ICONS.get(ext, '📄')
     
     def create_file_tree(self, files: Dict[str, Dict]) -> Dict:
         """
@@ -244,7 +371,7 @@ class FileManager:
             
             stats['total_size'] += size
             stats['languages'][lang] = stats['languages'].get(lang, 0) + 1
-            stats['line_count'] += len(file_info['content'].splitlines())
+            stats['line_count'] += FileManager.get_line_count(file_info)
             
             if size > stats['largest_file'][1]:
                 stats['largest_file'] = (file_name, size)
@@ -4,7 +4,6 @@ Manages interactions with OpenAI and Anthropic models with proper error handling
 rate limiting, and model-specific optimizations.
 """
 
-import pandas as pd
 from core.session import SessionManager
 import streamlit as st
 from typing import Dict, Optional, Tuple, Generator, List, Any, Union
@@ -12,13 +11,32 @@ from openai import OpenAI
 from anthropic import Anthropic
 import time
 from datetime import datetime
-import json
 import random
 import os
 import base64
 from PIL import Image
 from io import BytesIO
 
+@st.cache_resource
+def _api_clients() -> Dict[str, Any]:
+    """
+    Restituisce i client API, creati una sola volta per processo.
+    
+    Solo i client sono condivisi fra sessioni: non hanno stato per utente.
+    Rate limiting e statistiche restano per sessione in st.session_state.
+    
+    Returns:
+        Dict[str, Any]: Client OpenAI, Anthropic e Grok
+    """
+    return {
+        'openai': OpenAI(api_key=st.secrets["OPENAI_API_KEY"]),
+        'anthropic': Anthropic(api_key=st.secrets["ANTHROPIC_API_KEY"]),
+        'grok': OpenAI(
+            api_key=st.secrets["XAI_API_KEY"],
+            base_url="https://api.x.ai/v1"
+        )
+    }
+
 class LLMManager:
     """Gestisce le interazioni con i modelli LLM."""
     
@@ -28,26 +46,10 @@ class LLMManager:
     
     def __init__(self):
         """Inizializza le connessioni API e le configurazioni."""
-        self.openai_client = OpenAI(api_key=st.secrets["OPENAI_API_KEY"])
-        self.anthropic_client = Anthropic(api_key=st.secrets["ANTHROPIC_API_KEY"])
-        self.grok_client = OpenAI(
-            api_key=st.secrets["XAI_API_KEY"],
-            base_url="https://api.x.ai/v1"
-        )
-
-        # Initialize session state for message stats
-        if 'message_stats' not in st.session_state:
-            st.session_state.message_stats = []
-        
-        # Initialize total_stats in session state
-        if 'total_stats' not in st.session_state:
-            st.session_state.total_stats = {
-                'input_tokens': 0,
-                'output_tokens': 0,
-                'total_tokens': 0,
-                'total_cost': 0.0
-            }
-        
+        clients = _api_clients()
+        self.openai_client = clients['openai']
+        self.anthropic_client = clients['anthropic']
+        self.grok_client = clients['grok']
         
         # Costi per 1K tokens (in USD)
         self.cost_map = {
@@ -145,10 +147,19 @@ class LLMManager:
             }
         }
         
-        # Cache per rate limiting
-        self._last_call_time = {}
-        self._call_count = {}
-        self._reset_time = {}
+        # Stato del rate limiting per sessione: i dict vivono in session_state
+        # e vengono aggiornati in place, così sopravvivono ai rerun e non
+        # sono condivisi fra utenti diversi
+        if 'llm_rate_limits' not in st.session_state:
+            st.session_state.llm_rate_limits = {
+                'last_call_time': {},
+                'call_count': {},
+                'reset_time': {}
+            }
+        rate_limits = st.session_state.llm_rate_limits
+        self._last_call_time = rate_limits['last_call_time']
+        self._call_count = rate_limits['call_count']
+        self._reset_time = rate_limits['reset_time']
 
     def select_model(self, task_type: str, content_length: int, 
                     requires_file_handling: bool = False,
@@ -294,11 +305,12 @@ class LLMManager:
         
         st.session_state.message_stats.append(new_stat)
         
-        # Aggiorna i totali
-        st.session_state.total_stats['input_tokens'] += input_tokens
-        st.session_state.total_stats['output_tokens'] += output_tokens
-        st.session_state.total_stats['total_tokens'] += (input_tokens + output_tokens)
-        st.session_state.total_stats['total_cost'] += actual_cost
+        # Aggiorna i totali sul dict già in sessione, senza riscriverlo
+        totals = st.session_state.total_stats
+        totals['input_tokens'] += input_tokens
+        totals['output_tokens'] += output_tokens
+        totals['total_tokens'] += new_stat['total_tokens']
+        totals['total_cost'] += actual_cost
 
     def render_token_stats(self):
         """Renderizza le statistiche in modo sincronizzato."""
@@ -326,6 +338,8 @@ class LLMManager:
             # Mostra history completa
             if st.session_state.message_stats:
                 st.markdown("### History")
+                # pandas serve solo per la tabella della history
+                import pandas as pd
                 df = pd.DataFrame(st.session_state.message_stats)
                 # Formatta la colonna cost per mostrare 4 decimali
                 if 'cost' in df.columns:
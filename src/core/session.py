@@ -30,6 +30,14 @@ class SessionManager:
                 'tokens': 0,
                 'cost': 0.0
             }
+            # Statistiche dei messaggi LLM
+            st.session_state.message_stats = []
+            st.session_state.total_stats = {
+                'input_tokens': 0,
+                'output_tokens': 0,
+                'total_tokens': 0,
+                'total_cost': 0.0
+            }
     
     @staticmethod
     def update_api_stats(tokens: int, cost: float):
@@ -3,7 +3,6 @@ Allegro IO Code Assistant - Main Application
 Streamlit-based interface for code analysis using LLMs.
 """
 
-import time
 import streamlit as st
 from dotenv import load_dotenv
 from pathlib import Path
@@ -13,10 +12,6 @@ from datetime import datetime
 
 from utils.config import init_app_config
 
-# Force cache clear on startup
-st.cache_data.clear()
-st.cache_resource.clear()
-
 # Must be the first Streamlit call
 st.set_page_config(
     page_title="Allegro IO - Code Assistant",
@@ -29,95 +24,15 @@ root_path = Path(__file__).parent.parent
 sys.path.append(str(root_path))
 
 from src.core.session import SessionManager
-from src.core.llm import LLMManager
-from src.core.files import FileManager
-from src.ui.components import FileExplorer, ChatInterface, ModelSelector, load_custom_css
-
+from src.utils.helpers import BoundedSet
+from src.ui.components import FileExplorer, ChatInterface, CodeViewer, ModelSelector, load_custom_css
 
-def show_reset_animation():
-    """
-    Mostra un'animazione di reset con progresso.
-    """
-    # Aggiungi stile CSS per l'overlay di reset
-    st.markdown("""
-        <style>
-        @keyframes spin {
-            0% { transform: rotate(0deg); }
-            100% { transform: rotate(360deg); }
-        }
-        
-        .reset-overlay {
-            position: fixed;
-            top: 0;
-            left: 0;
-            width: 100vw;
-            height: 100vh;
-            background-color: rgba(255, 255, 255, 0.9);
-            z-index: 999999;
-            display: flex;
-            flex-direction: column;
-            justify-content: center;
-            align-items: center;
-            backdrop-filter: blur(5px);
-        }
-        
-        .reset-spinner {
-            width: 50px;
-            height: 50px;
-            border: 5px solid #f3f3f3;
-            border-top: 5px solid #3498db;
-            border-radius: 50%;
-            animation: spin 1s linear infinite;
-        }
-        
-        .reset-text {
-            margin-top: 20px;
-            font-size: 1.2em;
-            color: #2c3e50;
-        }
-        
-        .progress-bar {
-            width: 300px;
-            height: 4px;
-            background-color: #f3f3f3;
-            border-radius: 2px;
-            margin-top: 20px;
-            overflow: hidden;
-        }
-        
-        .progress-value {
-            width: 0%;
-            height: 100%;
-            background-color: #3498db;
-            animation: progress 2s ease-in-out forwards;
-        }
-        
-        @keyframes progress {
-            0% { width: 0%; }
-            100% { width: 100%; }
-        }
-        </style>
-        
-        <div class="reset-overlay">
-            <div class="reset-spinner"></div>
-            <div class="reset-text">Resetting Allegro...</div>
-            <div class="progress-bar">
-                <div class="progress-value"></div>
-            </div>
-        </div>
-    """, unsafe_allow_html=True)
-    
-    # Forza un breve delay per mostrare l'animazione
-    time.sleep(2)
 
 def perform_full_reset():
     """
-    Esegue un reset completo dell'applicazione con animazione.
+    Esegue un reset completo dell'applicazione.
     """
     try:
-        # Mostra l'animazione di reset
-        show_reset_animation()
-        
         # Clear all Streamlit caches
         st.cache_data.clear()
         st.cache_resource.clear()
@@ -140,7 +55,10 @@ def perform_full_reset():
         
         # Reset file management
         st.session_state.uploaded_files = {}
-        st.session_state.file_messages_sent = set()
+        st.session_state.file_messages_sent = BoundedSet()
+        st.session_state.zip_archives = {}
+        st.session_state.processed_uploads = set()
+        st.session_state.uploaded_files_version = 0
         
         # Reset chat state
         st.session_state.chats = {
@@ -188,58 +106,10 @@ def check_directories():
             st.warning(f"⚠️ Missing directory {dir_name}. Creating...")
             dir_path.mkdir(parents=True, exist_ok=True)
 
-@st.cache_resource
-def init_clients():
-    """Initialize and cache API clients."""
-    return {
-        'llm': LLMManager(),
-        'session': SessionManager(),
-        'file_manager': FileManager()
-    }
-
 def render_main_layout():
     """Render the main application layout."""
     # Initial setup
-    clients = init_clients()
-    clients['session'].init_session()
-    
-    # CSS per layout e posizionamento
-    st.markdown("""
-        <style>
-        /* Chat container margins */
-        div[data-testid="stChatMessageContainer"] {
-            margin-bottom: 100px;
-        }
-        
-        /* Fixed footer container */
-        .stChatFloatingInputContainer {
-            bottom: 0 !important;
-            background: white !important;
-            padding: 0 !important;
-            padding-top: 8px !important;
-        }
-
-        /* Quick prompts styling */
-        .st-emotion-cache-desfit {
-            margin-bottom: 8px !important;
-        }
-        
-        .stButton button {
-            min-height: 32px !important;
-            line-height: 1.1 !important;
-            margin: 0 !important;
-            background: #f0f2f6 !important;
-            color: #31333F !important;
-            border-radius: 16px !important;
-            border: none !important;
-        }
-        
-        .stButton button:hover {
-            background: #e0e2e6 !important;
-            color: #131415 !important;
-        }
-        </style>
-    """, unsafe_allow_html=True)
+    SessionManager.init_session()
     
     # Header area
     header_container = st.container()
@@ -265,26 +135,17 @@ def render_main_layout():
         st.markdown("### 📁 File Manager")
         FileExplorer().render()
     
+    # Contenuto del file selezionato nel file explorer
+    if selected_file := st.session_state.get('selected_file'):
+        with st.expander(f"📄 {selected_file}", expanded=False):
+            CodeViewer().render()
+    
     # Main Chat Area
     chat_container = st.container()
     with chat_container:
         st.markdown("### 💬 Chat")
-        chat_interface = ChatInterface()
-        chat_interface.render()
-    
-    # Footer con quick prompts e input
-    cols = st.columns(4)
-    prompts = chat_interface.quick_prompts.get(st.session_state.current_model, 
-                                             chat_interface.quick_prompts['default'])
-    # Quick prompts all'interno del container di input
-    for i, prompt in enumerate(prompts):
-        if cols[i % 4].button(prompt, key=f"quick_prompt_{i}", 
-                            use_container_width=True):
-            chat_interface.process_user_message(prompt)
-    
-    # Chat input
-    if prompt := st.chat_input("Tu chiedere, io rispondere"):
-        chat_interface.process_user_message(prompt)
+        # Quick prompts e chat input sono renderizzati dentro il fragment
+        ChatInterface().render()
 
 def main():
     """Main application function."""
@@ -2,140 +2,284 @@
 UI components for Allegro IO Code Assistant.
 """
 
+import html
+import io
+import re
+import time
+import zipfile
+from array import array
 import streamlit as st
-import pandas as pd
 from datetime import datetime
 from src.core.session import SessionManager
 from src.core.files import FileManager
 from src.core.llm import LLMManager
-from typing import Dict, Any
+from src.utils.helpers import BoundedSet
+from functools import lru_cache
+from itertools import islice
+from typing import Dict, Any, Iterator, List, Tuple
+
+# Entry ZIP da ignorare a qualsiasi livello: file e cartelle nascosti
+# (.git, .DS_Store, ...), cache Python e metadati macOS
+_SKIP_ZIP_ENTRY = re.compile(r'(?:^|/)(?:\.|__pycache__/|__MACOSX/)')
+
+# CSS statico dell'app, costruito una sola volta all'import del modulo
+_CUSTOM_CSS = """
+    <style>
+       [data-testid="stChatMessage"] [data-testid="stVerticalBlock"] {
+            gap: 0 !important;
+       }
+       
+       /* File Explorer: albero dei file nel file explorer */
+       [data-testid="stSidebar"] pre.file-tree {
+            font-family: monospace !important;
+            font-size: 0.9em !important;
+            white-space: pre !important;
+            line-height: 1.5 !important;
+            margin: 0 !important;
+            padding: 0 !important;
+            background: none !important;
+            color: var(--text-color) !important;
+       }
+       
+       /* Layout: margini chat e footer fisso */
+       div[data-testid="stChatMessageContainer"] {
+            margin-bottom: 100px;
+       }
+       
+       .stChatFloatingInputContainer {
+            bottom: 0 !important;
+            background: white !important;
+            padding: 0 !important;
+            padding-top: 8px !important;
+       }
+       
+       /* Quick prompts */
+       .st-emotion-cache-desfit {
+            margin-bottom: 8px !important;
+       }
+       
+       .stButton button {
+            min-height: 32px !important;
+            line-height: 1.1 !important;
+            margin: 0 !important;
+            background: #f0f2f6 !important;
+            color: #31333F !important;
+            border-radius: 16px !important;
+            border: none !important;
+       }
+       
+       .stButton button:hover {
+            background: #e0e2e6 !important;
+            color: #131415 !important;
+       }
+    </style>
+"""
+
+def _coalesced(stream: Iterator[str], hz: int = 10, max_chars: int = 256) -> Iterator[str]:
+    """
+    Raggruppa i chunk di uno stream LLM prima di inviarli alla UI.
+    
+    Ogni aggiornamento dello stream è un messaggio verso il browser:
+    accumulando i token e svuotando il buffer al massimo hz volte al secondo
+    (o quando supera max_chars caratteri) i messaggi calano di un ordine di
+    grandezza senza ritardare il primo token.
+    
+    Args:
+        stream: Generatore di chunk testuali
+        hz: Frequenza massima di flush
+        max_chars: Dimensione del buffer oltre la quale si forza il flush
+        
+    Yields:
+        str: Chunk accorpati
+    """
+    interval = 1_000_000_000 // hz
+    buffer = []
+    size = 0
+    last_flush = time.monotonic_ns()
+    for chunk in stream:
+        if not chunk:
+            continue
+        buffer.append(chunk)
+        size += len(chunk)
+        now = time.monotonic_ns()
+        if size >= max_chars or now - last_flush >= interval:
+            yield "".join(buffer)
+            buffer.clear()
+            size = 0
+            last_flush = now
+    if buffer:
+        yield "".join(buffer)
+
+def _stream_markdown(stream: Iterator[str]) -> str:
+    """
+    Mostra uno stream markdown in un unico placeholder del container corrente.
+    
+    Il numero di riparsing è limitato da _coalesced. Il testo viene sempre
+    renderizzato per intero nello stesso elemento, quindi al termine ciò che
+    è mostrato coincide con il messaggio salvato nella chat.
+    
+    Args:
+        stream: Generatore di chunk markdown
+        
+    Returns:
+        str: Testo completo della risposta
+    """
+    placeholder = st.empty()
+    parts = []
+    for chunk in stream:
+        parts.append(chunk)
+        placeholder.markdown("".join(parts))
+    return "".join(parts)
+
+# cache_resource è condivisa tra tutte le sessioni: vi restano solo manager
+# senza stato d'istanza, che leggono e scrivono st.session_state
+@st.cache_resource
+def _session_manager() -> SessionManager:
+    """Restituisce il SessionManager condiviso (solo metodi statici)."""
+    return SessionManager()
+
+@st.cache_resource
+def _file_manager() -> FileManager:
+    """Restituisce il FileManager condiviso (nessuno stato d'istanza)."""
+    return FileManager()
 
 def load_custom_css():
-    st.markdown("""
-        <style>
-           [data-testid="stChatMessage"] [data-testid="stVerticalBlock"] {
-                gap: 0 !important;
-           }
-        </style>
-    """, unsafe_allow_html=True)
+    # Va emesso a ogni run: Streamlit rimuove gli elementi non riemessi
+    st.markdown(_CUSTOM_CSS, unsafe_allow_html=True)
+
+@st.cache_data(show_spinner=False)
+def _build_tree(paths: Tuple[str, ...]) -> Dict[str, Any]:
+    """
+    Crea una struttura ad albero dai path dei file caricati.
+    
+    Dipende solo dai path, non dai contenuti: l'albero è condiviso fra
+    sessioni e ricostruito solo per un insieme di file mai visto.
+    
+    Args:
+        paths: Path dei file caricati
+        
+    Returns:
+        Dict con la struttura ad albero (le foglie sono i path completi)
+    """
+    tree = {}
+    # Ordina una sola volta per componenti del path: i dict mantengono
+    # l'ordine di inserimento, quindi i figli di ogni nodo sono già ordinati
+    for parts, path in sorted((path.split('/'), path) for path in paths):
+        current = tree
+        
+        # Processa tutte le parti tranne l'ultima (file)
+        for part in parts[:-1]:
+            current = current.setdefault(part, {})
+        
+        current[parts[-1]] = path
+        
+    return tree
 
 class FileExplorer:
     """Component per l'esplorazione e l'upload dei file."""
     
     def __init__(self):
-        self.session = SessionManager()
-        self.file_manager = FileManager()
+        self.session = _session_manager()
+        self.file_manager = _file_manager()
         if 'uploaded_files' not in st.session_state:
             st.session_state.uploaded_files = {}
         if 'file_messages_sent' not in st.session_state:
-            st.session_state.file_messages_sent = set()
-
-    def _get_file_icon(self, filename: str) -> str:
+            st.session_state.file_messages_sent = BoundedSet()
+        if 'zip_archives' not in st.session_state:
+            st.session_state.zip_archives = {}
+        if 'processed_uploads' not in st.session_state:
+            st.session_state.processed_uploads = set()
+        if 'uploaded_files_version' not in st.session_state:
+            st.session_state.uploaded_files_version = 0
+
+    @staticmethod
+    @lru_cache(maxsize=4096)
+    def _get_file_icon(filename: str) -> str:
         """Restituisce l'icona appropriata per il tipo di file."""
-        ext = filename.split('.')[-1].lower() if '.' in filename else ''
-        icons = {
-            'py': '🐍',
-            'js': '📜',
-            'jsx': '⚛️',
-            'ts': '📘',
-            'tsx': '💠',
-            'html': '🌐',
-            'css': '🎨',
-            'md': '📝',
-            'txt': '📄',
-            'json': '📋',
-            'yaml': '⚙️',
-            'yml': '⚙️',
-            'zip': '📦'
-        }
-        return icons.get(ext, '📄')
+        return FileManager.get_file_icon(filename)
 
-    def _create_file_tree(self, files: Dict[str, Any]) -> Dict[str, Any]:
+    def _get_tree_html(self) -> str:
         """
-        Crea una struttura ad albero dai file caricati.
+        Restituisce l'HTML dell'albero dei file, ricostruendolo solo se
+        uploaded_files_version è cambiata.
+        
+        Returns:
+            str: Blocco <pre> con l'albero
+        """
+        version = st.session_state.uploaded_files_version
+        cached = st.session_state.get('file_tree_cache')
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        
+        files = st.session_state.uploaded_files
+        tree_html = self._tree_html(_build_tree(tuple(sorted(files))))
+        st.session_state.file_tree_cache = (version, tree_html)
+        return tree_html
+
+    def _tree_html(self, tree: Dict[str, Any]) -> str:
+        """
+        Costruisce l'intero albero dei file come un'unica stringa HTML.
+        
+        Visita iterativa in profondità: lo stack contiene i nodi ancora da
+        scrivere con il prefisso del loro livello, condiviso fra fratelli.
         
         Args:
-            files: Dict con i file caricati
+            tree: Struttura ad albero creata da _build_tree
             
         Returns:
-            Dict con la struttura ad albero
+            str: Blocco <pre> con l'albero, da emettere con un solo st.markdown
         """
-        tree = {}
-        for path, content in files.items():
-            current = tree
-            parts = path.split('/')
-            
-            # Processa tutte le parti tranne l'ultima (file)
-            for part in parts[:-1]:
-                if part not in current:
-                    current[part] = {}
-                current = current[part]
+        lines = []
+        last = len(tree) - 1
+        stack = [(name, node, "", i == last) for i, (name, node) in enumerate(tree.items())]
+        stack.reverse()
+        while stack:
+            name, node, prefix, is_last = stack.pop()
+            connector = '└── ' if is_last else '├── '
             
-            # Aggiungi il file con il path completo
-            current[parts[-1]] = {'content': content, 'full_path': path}
-            
-        return tree
-
-    def _render_tree_node(self, path: str, node: Dict[str, Any], prefix: str = ""):
-        """Renderizza un nodo dell'albero dei file con pipe style."""
-        items = list(sorted(node.items()))
-        for i, (name, content) in enumerate(items):
-            is_last = i == len(items) - 1
-            
-            if isinstance(content, dict) and 'content' not in content:
-                # Directory
-                st.markdown(f"{prefix}{'└── ' if is_last else '├── '}📁 **{name}/**", unsafe_allow_html=True)
-                new_prefix = prefix + ("    " if is_last else "│   ")
-                self._render_tree_node(f"{path}/{name}", content, new_prefix)
+            if isinstance(node, dict):
+                # Directory: i figli vengono impilati in ordine inverso
+                # così escono dallo stack nell'ordine già ordinato
+                lines.append(f"{prefix}{connector}📁 <b>{html.escape(name)}/</b>")
+                child_prefix = prefix + ("    " if is_last else "│   ")
+                last = len(node) - 1
+                children = [(child, sub, child_prefix, i == last)
+                            for i, (child, sub) in enumerate(node.items())]
+                children.reverse()
+                stack.extend(children)
             else:
-                # File
-                icon = self._get_file_icon(name)
-                full_path = content['full_path']
-                file_button = f"{prefix}{'└── ' if is_last else '├── '}{icon} {name}"
-                
-                if st.button(file_button, key=f"file_{full_path}", use_container_width=True):
-                    st.session_state.selected_file = full_path
-                    st.session_state.current_file = full_path
+                # File (solo visualizzazione, la selezione avviene nel selectbox)
+                lines.append(f"{prefix}{connector}{self._get_file_icon(name)} {html.escape(name)}")
+        return '<pre class="file-tree">' + "\n".join(lines) + '</pre>'
+
+    def _render_file_selector(self):
+        """
+        Renderizza un unico widget per la selezione del file.
+        
+        Sostituisce i bottoni per singolo file: un solo widget registrato
+        per rerun indipendentemente dal numero di file caricati.
+        """
+        # Stesso ordine dell'albero (per componenti del path)
+        paths = sorted(st.session_state.uploaded_files, key=lambda path: path.split('/'))
+        current = st.session_state.get('selected_file')
+        uploaded = st.session_state.uploaded_files
+        selected = st.selectbox(
+            "File",
+            options=paths,
+            index=paths.index(current) if current in paths else None,
+            # I file binari restano visibili ma segnalati: non entrano nel contesto
+            format_func=lambda path: f"{self._get_file_icon(path)} {path}"
+                + (" (binario)" if uploaded[path].get('binary') else ""),
+            placeholder="Seleziona un file...",
+            key="file_selector",
+            label_visibility="collapsed"
+        )
+        if selected and selected != current:
+            st.session_state.selected_file = selected
+            st.session_state.current_file = selected
 
     def render(self):
         """Renderizza il componente."""
-        st.markdown("""
-            <style>
-                /* File Explorer specifico */
-            [data-testid="stSidebar"] .stButton > button {
-                width: auto;
-                text-align: left !important;
-                padding: 2px 8px !important;
-                background: none !important;
-                border: none !important;
-                font-family: monospace !important;
-                font-size: 0.9em !important;
-                white-space: pre !important;
-                line-height: 1.5 !important;
-                color: var(--text-color) !important;
-            }
-            
-            [data-testid="stSidebar"] .stButton > button:hover {
-                background-color: var(--primary-color-light) !important;
-                color: var(--primary-color) !important;
-            }
-            
-            [data-testid="stSidebar"] .element-container:has(button[kind="secondary"]) {
-                margin: 0 !important;
-                padding: 0 !important;
-            }
-            
-            /* Solo per i markdown delle directory nel file explorer */
-            [data-testid="stSidebar"] [data-testid="stMarkdownContainer"] p {
-                font-family: monospace !important;
-                font-size: 0.9em !important;
-                white-space: pre !important;
-                line-height: 1.5 !important;
-                margin: 0 !important;
-            }
-        </style>
-        """, unsafe_allow_html=True)
-
         uploaded_files = st.file_uploader(
         label=" ",
         type=['py', 'js', 'jsx', 'ts', 'tsx', 'html', 'css', 'md', 'txt', 'json', 'yml', 'yaml', 'zip'],
@@ -146,66 +290,121 @@ class FileExplorer:
 
         if uploaded_files:
             new_files = []
+            # Riferimento locale: evita un accesso a session_state per ogni entry
+            uploaded = st.session_state.uploaded_files
             for file in uploaded_files:
+                # Lo uploader restituisce gli stessi file a ogni rerun:
+                # quelli già processati vengono saltati senza rileggerli
+                if file.file_id in st.session_state.processed_uploads:
+                    continue
                 try:
                     # Gestione file ZIP
                     if file.name.endswith('.zip'):
-                        import zipfile
-                        import io
-                        
-                        zip_content = zipfile.ZipFile(io.BytesIO(file.read()))
-                        for zip_file in zip_content.namelist():
-                            if not zip_file.startswith('__') and not zip_file.startswith('.'):
-                                try:
-                                    if zip_file in st.session_state.uploaded_files:
-                                        continue
-                                        
-                                    content = zip_content.read(zip_file).decode('utf-8', errors='ignore')
-                                    st.session_state.uploaded_files[zip_file] = {
-                                        'content': content,
-                                        'language': zip_file.split('.')[-1],
-                                        'name': zip_file
-                                    }
-                                    new_files.append(zip_file)
-                                except Exception:
-                                    continue
-                    else:
-                        if file.name in st.session_state.uploaded_files:
-                            continue
-                            
-                        content = file.read().decode('utf-8')
-                        st.session_state.uploaded_files[file.name] = {
-                            'content': content,
-                            'language': file.name.split('.')[-1],
-                            'name': file.name
+                        # L'archivio resta in sessione: le entry vengono
+                        # decompresse solo quando il loro contenuto serve
+                        zip_content = zipfile.ZipFile(io.BytesIO(file.getvalue()))
+                        st.session_state.zip_archives[file.file_id] = zip_content
+                        for info in zip_content.infolist():
+                            zip_file = info.filename
+                            if info.is_dir() or _SKIP_ZIP_ENTRY.search(zip_file):
+                                continue
+                            # Solo estensioni di testo supportate (niente immagini, .pyc, ...)
+                            if '.' + zip_file.rpartition('.')[2].lower() not in FileManager.ALLOWED_EXTENSIONS:
+                                continue
+                            if zip_file in uploaded:
+                                continue
+                            try:
+                                # Basta decomprimere l'inizio dell'entry per
+                                # riconoscere un file binario
+                                with zip_content.open(info) as entry:
+                                    binary = FileManager.is_binary(entry.read(8192))
+                            except Exception:
+                                # Entry illeggibile (cifrata, compressione non
+                                # supportata, ...): si salta solo questa
+                                continue
+                            uploaded[zip_file] = {
+                                'language': zip_file.rpartition('.')[2],
+                                'name': zip_file,
+                                'size': info.file_size,
+                                'archive': file.file_id,
+                                'binary': binary
+                            }
+                            new_files.append(zip_file)
+                    elif file.name not in uploaded:
+                        # I byte vengono decodificati solo al primo accesso
+                        raw = file.getvalue()
+                        uploaded[file.name] = {
+                            'raw': raw,
+                            'language': file.name.rpartition('.')[2],
+                            'name': file.name,
+                            'size': len(raw),
+                            'binary': FileManager.is_binary(raw)
                         }
                         new_files.append(file.name)
+                    st.session_state.processed_uploads.add(file.file_id)
                 except Exception as e:
                     st.error(f"Error processing {file.name}: {str(e)}")
+                    # Segnato come processato anche in caso di errore: a ogni
+                    # rerun non verrebbe riletto solo per fallire di nuovo.
+                    # L'archivio resta in sessione se le entry già aggiunte
+                    # vi fanno riferimento
+                    st.session_state.processed_uploads.add(file.file_id)
+                    if not any(info.get('archive') == file.file_id for info in uploaded.values()):
+                        st.session_state.zip_archives.pop(file.file_id, None)
+
+            if new_files:
+                # Invalida le cache derivate dall'insieme dei file caricati
+                st.session_state.uploaded_files_version += 1
 
             if new_files and 'chats' in st.session_state and st.session_state.current_chat in st.session_state.chats:
-                files_message = "📂 Nuovi file caricati:\n"
-                for filename in new_files:
-                    files_message += f"- {self._get_file_icon(filename)} {filename}\n"
-                
-                message_hash = hash(files_message)
-                if message_hash not in st.session_state.file_messages_sent:
+                # Deduplica sull'insieme dei nomi: il messaggio viene
+                # costruito solo se non è già stato inviato. La chiave è il
+                # frozenset stesso, quindi niente ordinamento né collisioni
+                message_key = frozenset(new_files)
+                if message_key not in st.session_state.file_messages_sent:
+                    files_message = "📂 Nuovi file caricati:\n" + "".join(
+                        f"- {self._get_file_icon(filename)} {filename}\n"
+                        for filename in new_files
+                    )
                     st.session_state.chats[st.session_state.current_chat]['messages'].append({
                         "role": "system",
                         "content": files_message
                     })
-                    st.session_state.file_messages_sent.add(message_hash)
+                    st.session_state.file_messages_sent.add(message_key)
 
         if st.session_state.uploaded_files:
             st.markdown("### 📁 Files")
-            tree = self._create_file_tree(st.session_state.uploaded_files)
-            self._render_tree_node("", tree, "")
+            st.markdown(self._get_tree_html(), unsafe_allow_html=True)
+            self._render_file_selector()
 
 class ChatInterface:
     """Componente per l'interfaccia chat."""
+    
+    # Messaggi renderizzati a ogni rerun; i precedenti si caricano a richiesta
+    HISTORY_WINDOW = 50
+    
+    # Quick prompts predefiniti per ogni tipo di modello, condivisi fra istanze
+    quick_prompts = {
+        'default': (
+            "Analizza questo codice",
+            "Trova potenziali bug",
+            "Suggerisci miglioramenti",
+            "Spiega il funzionamento"
+        ),
+        'grok-vision-beta': (
+            "Descrivi questa immagine",
+            "Trova testo nell'immagine",
+            "Analizza i colori",
+            "Identifica gli oggetti"
+        )
+    }
+    
     def __init__(self):
-        self.session = SessionManager()
+        self.session = _session_manager()
+        # Istanza per run: i client API sono già condivisi in src.core.llm,
+        # lo stato del rate limiting è per sessione
         self.llm = LLMManager()
+        self.messages_container = None
         if 'chats' not in st.session_state:
             st.session_state.chats = {
                 'Chat principale': {
@@ -214,22 +413,6 @@ class ChatInterface:
                 }
             }
             st.session_state.current_chat = 'Chat principale'
-            
-        # Quick prompts predefiniti per ogni tipo di modello
-        self.quick_prompts = {
-            'default': [
-                "Analizza questo codice",
-                "Trova potenziali bug",
-                "Suggerisci miglioramenti",
-                "Spiega il funzionamento"
-            ],
-            'grok-vision-beta': [
-                "Descrivi questa immagine",
-                "Trova testo nell'immagine",
-                "Analizza i colori",
-                "Identifica gli oggetti"
-            ]
-        }
 
     def create_new_chat(self):
         """Crea una nuova chat."""
@@ -247,14 +430,14 @@ class ChatInterface:
             'created_at': datetime.now().isoformat()
         }
         st.session_state.current_chat = new_name
-        st.rerun()
+        st.rerun(scope="fragment")
 
     def delete_current_chat(self):
         """Elimina la chat corrente."""
         if len(st.session_state.chats) > 1:  # Mantieni almeno una chat
             del st.session_state.chats[st.session_state.current_chat]
             st.session_state.current_chat = list(st.session_state.chats.keys())[0]
-            st.rerun()
+            st.rerun(scope="fragment")
 
     def rename_chat(self, new_name: str):
         """Rinomina la chat corrente."""
@@ -263,86 +446,7 @@ class ChatInterface:
                 st.session_state.chats[new_name] = st.session_state.chats.pop(st.session_state.current_chat)
                 st.session_state.current_chat = new_name
                 st.rerun()
-
     
-    def render_quick_prompts(self):
-        """Renderizza i quick prompts sopra la chat input bar."""
-        # Inject CSS using markdown
-        st.markdown("""
-            <style>
-            div.quick-prompts-wrapper {
-                position: fixed;
-                bottom: 80px;
-                left: 0;
-                right: 0;
-                background: white;
-                padding: 8px 16px;
-                border-top: 1px solid rgba(49, 51, 63, 0.2);
-                z-index: 999;
-                display: flex;
-                gap: 8px;
-                overflow-x: auto;
-            }
-            
-            div.quick-prompts-wrapper button {
-                background-color: #f0f2f6;
-                border: none;
-                border-radius: 16px;
-                padding: 6px 12px;
-                font-size: 14px;
-                color: #31333F;
-                cursor: pointer;
-                white-space: nowrap;
-                transition: all 0.2s;
-                min-height: 32px;
-                line-height: 1.1;
-                margin: 0;
-            }
-            
-            div.quick-prompts-wrapper button:hover {
-                background-color: #e0e2e6;
-                color: #131415;
-            }
-            
-            div.main .block-container {
-                padding-bottom: 140px;
-            }
-            
-            @media (max-width: 768px) {
-                div.quick-prompts-wrapper {
-                    padding: 8px;
-                }
-                
-                div.quick-prompts-wrapper button {
-                    padding: 4px 8px;
-                    font-size: 12px;
-                }
-            }
-            </style>
-        """, unsafe_allow_html=True)
-
-        # Create container for quick prompts
-        prompts = self.quick_prompts.get(
-            st.session_state.current_model, 
-            self.quick_prompts['default']
-        )
-
-        # Create a container div with our custom class
-        st.markdown('<div class="quick-prompts-wrapper">', unsafe_allow_html=True)
-        
-        # Use columns for responsive layout
-        cols = st.columns(len(prompts))
-        for i, prompt in enumerate(prompts):
-            with cols[i]:
-                if st.button(
-                    prompt,
-                    key=f"quick_prompt_{i}",
-                    use_container_width=True
-                ):
-                    self.process_user_message(prompt)
-        
-        st.markdown('</div>', unsafe_allow_html=True)
-
     def render_token_stats(self):
         """Renderizza le statistiche dei token."""
         if not hasattr(st.session_state, 'message_stats'):
@@ -356,50 +460,80 @@ class ChatInterface:
         
         with st.expander("📊 Token Usage Statistics", expanded=False):
             # Mostra i totali dalla session state
+            totals = st.session_state.total_stats
+            message_stats = st.session_state.message_stats
             cols = st.columns(4)
             with cols[0]:
-                st.metric("Input Tokens", st.session_state.total_stats['input_tokens'])
+                st.metric("Input Tokens", totals['input_tokens'])
             with cols[1]:
-                st.metric("Output Tokens", st.session_state.total_stats['output_tokens'])
+                st.metric("Output Tokens", totals['output_tokens'])
             with cols[2]:
-                st.metric("Total Tokens", st.session_state.total_stats['total_tokens'])
+                st.metric("Total Tokens", totals['total_tokens'])
             with cols[3]:
-                st.metric("Cost ($)", f"${st.session_state.total_stats['total_cost']:.4f}")
+                st.metric("Cost ($)", f"${totals['total_cost']:.4f}")
             
             # Mostra history completa
-            if st.session_state.message_stats:
+            if message_stats:
                 st.markdown("### History")
-                df = pd.DataFrame(st.session_state.message_stats)
+                # pandas serve solo per la tabella della history
+                import pandas as pd
+                df = pd.DataFrame(message_stats)
                 st.dataframe(
                     df.sort_values('timestamp', ascending=False),
                     use_container_width=True
                 )
     
-    def _process_response(self, prompt: str) -> str:
-        """Processa la richiesta e genera una risposta."""
-        try:
-            # Prepara il contesto completo per l'LLM
-            context = ""
-            for filename, file_info in st.session_state.uploaded_files.items():
-                context += f"\nFile: {filename}\n```{file_info['language']}\n{file_info['content']}\n```\n"
-
-            response = ""
-            placeholder = st.empty()
-            with st.spinner("Analyzing code..."):
-                for chunk in self.llm.process_request(
-                    prompt=prompt,
-                    context=context
-                ):
-                    response += chunk
-                    # Aggiorna il placeholder con la risposta parziale
-                    with placeholder:
-                        st.markdown(response)
-            return response
-        except Exception as e:
-            error_msg = f"Mi dispiace, si è verificato un errore: {str(e)}"
-            st.error(error_msg)
-            return error_msg
-    
+    def _get_context(self) -> str:
+        """
+        Restituisce il contesto dei file caricati da inviare all'LLM.
+        
+        Il contesto resta in cache finché uploaded_files_version non cambia.
+        Se i file in cache sono ancora i primi caricati (stessi nomi e stessi
+        oggetti), il testo già costruito è un prefisso valido e si accodano
+        solo i blocchi dei file nuovi; se un file è stato rimosso o
+        sostituito il contesto viene ricostruito da capo.
+        
+        Il compromesso è voluto: il testo del contesto viene inviato a ogni
+        messaggio, quindi tenerlo in cache evita di decomprimere di nuovo le
+        entry ZIP a ogni richiesta, al costo di conservarne una copia in
+        sessione.
+        
+        Returns:
+            str: Contesto con il contenuto di tutti i file caricati
+        """
+        uploaded_files = st.session_state.get('uploaded_files')
+        if not uploaded_files:
+            return ""
+        
+        version = st.session_state.get('uploaded_files_version', 0)
+        cached = st.session_state.get('context_cache')
+        if cached is not None and cached['version'] == version:
+            return cached['text']
+        
+        # Confronto per identità: un file sostituito con lo stesso nome ha
+        # un nuovo dict di metadati e invalida il prefisso
+        is_prefix = cached is not None and len(cached['files']) <= len(uploaded_files) and all(
+            name == cached_name and file_info is cached_info
+            for (name, file_info), (cached_name, cached_info)
+            in zip(uploaded_files.items(), cached['files'])
+        )
+        blocks = [cached['text']] if is_prefix else []
+        start = len(cached['files']) if is_prefix else 0
+        for filename, file_info in islice(uploaded_files.items(), start, None):
+            content = FileManager.get_content(file_info)
+            if not content:
+                # File binari o vuoti: nessun blocco vuoto nel contesto LLM
+                continue
+            blocks.append(f"\nFile: {filename}\n```{file_info['language']}\n{content}\n```\n")
+        
+        context = "".join(blocks)
+        st.session_state.context_cache = {
+            'version': version,
+            'files': tuple(uploaded_files.items()),
+            'text': context
+        }
+        return context
+
     def process_user_message(self, prompt: str):
         """Processa un messaggio utente."""
         if not prompt.strip():
@@ -412,9 +546,11 @@ class ChatInterface:
 
         # Gestione immagine corrente se presente
         current_image = st.session_state.get('current_image')
+        current_model = st.session_state.current_model
+        use_vision = bool(current_image) and current_model == 'grok-vision-beta'
         
         # Prepara il contenuto del messaggio
-        if current_image and st.session_state.current_model == 'grok-vision-beta':
+        if use_vision:
             message_content = {
                 "image": current_image,
                 "text": prompt
@@ -422,35 +558,36 @@ class ChatInterface:
         else:
             message_content = prompt
 
-        # Aggiungi il messaggio utente alla chat
-        messages.append({
+        # Aggiungi il messaggio utente alla chat e mostralo subito nel
+        # container dei messaggi, senza forzare un rerun. Viene chiamato solo
+        # da render(), quindi il container appartiene allo stesso fragment
+        user_message = {
             "role": "user",
             "content": message_content
-        })
+        }
+        messages.append(user_message)
+        with self.messages_container:
+            self._render_message(user_message)
 
         try:
             # Prepara il generatore di risposta appropriato
-            if current_image and st.session_state.current_model == 'grok-vision-beta':
+            if use_vision:
                 image_bytes = current_image.getvalue()
                 response_generator = self.llm.process_image_request(image_bytes, prompt)
             else:
                 # Ottieni il contesto dai file se presenti
-                context = ""
-                if hasattr(st.session_state, 'uploaded_files') and st.session_state.uploaded_files:
-                    for filename, file_info in st.session_state.uploaded_files.items():
-                        context += f"\nFile: {filename}\n```{file_info['language']}\n{file_info['content']}\n```\n"
+                context = self._get_context()
                 
                 response_generator = self.llm.process_request(
                     prompt=prompt,
                     context=context
                 )
 
-            # Accumula la risposta completa
-            response = ""
-            with st.spinner("Elaborazione in corso..."):
-                for chunk in response_generator:
-                    if chunk:
-                        response += chunk
+            # Mostra la risposta in streaming direttamente nella chat
+            with self.messages_container:
+                with st.chat_message("assistant", avatar="👲🏿"):
+                    with st.spinner("Elaborazione in corso..."):
+                        response = _stream_markdown(_coalesced(response_generator))
                         
             # Aggiungi la risposta completa alla chat solo se non è vuota
             if response.strip():
@@ -462,26 +599,26 @@ class ChatInterface:
             # Aggiorna le statistiche dei token se disponibili
             if hasattr(self.llm, 'update_message_stats'):
                 self.llm.update_message_stats(
-                    model=st.session_state.current_model,
+                    model=current_model,
                     input_tokens=len(prompt) // 4,
                     output_tokens=len(response) // 4,
                     cost=0.0
                 )
-                
-            st.rerun()
 
         except Exception as e:
             error_msg = f"Si è verificato un errore durante l'elaborazione: {str(e)}"
             st.error(error_msg)
             
-            messages.append({
+            error_message = {
                 "role": "assistant",
                 "content": f"🚨 {error_msg}"
-            })
+            }
+            messages.append(error_message)
+            with self.messages_container:
+                self._render_message(error_message)
             
             if st.session_state.config.get('DEBUG', False):
                 st.exception(e)
-            st.rerun()
 
     def handle_user_input(self, prompt: str):
         """
@@ -498,140 +635,227 @@ class ChatInterface:
     def render_chat_controls(self):
         """Renderizza i controlli della chat."""
         col1, col2, col3 = st.columns([4, 1, 1])
+        chat_names = list(st.session_state.chats)
         
         with col1:
             current_chat = st.selectbox(
                 " ",
-                options=list(st.session_state.chats.keys()),
-                index=list(st.session_state.chats.keys()).index(st.session_state.current_chat),
+                options=chat_names,
+                index=chat_names.index(st.session_state.current_chat),
                 label_visibility="collapsed"
             )
+            # La nuova chat è già attiva per i messaggi renderizzati sotto:
+            # non serve un rerun aggiuntivo
             if current_chat != st.session_state.current_chat:
                 st.session_state.current_chat = current_chat
-                st.rerun()
             
         with col2:
             if st.button("🆕", help="Nuova chat"):
                 self.create_new_chat()
                 
         with col3:
-            if len(st.session_state.chats) > 1 and st.button("🗑️", help="Elimina chat"):
+            if len(chat_names) > 1 and st.button("🗑️", help="Elimina chat"):
                 self.delete_current_chat()
 
+    @st.fragment
     def render(self):
-        """Renderizza l'interfaccia chat."""
+        """
+        Renderizza l'interfaccia chat.
+        
+        È un fragment: le interazioni con i controlli della chat rieseguono
+        solo questo blocco, non file explorer, model selector e layout.
+        Anche quick prompts e chat input stanno nel fragment, così messaggi
+        e risposte in streaming appartengono al fragment e vengono rimossi
+        correttamente ai suoi rerun (cambio chat, messaggi precedenti, ...).
+        """
         # Render chat controls
         self.render_chat_controls()
         
-        # Render token stats
-        self.render_token_stats()
-        
+        # Le statistiche vengono scritte a fine run, dopo l'eventuale nuovo
+        # messaggio, ma restano visualizzate sopra la chat
+        stats_container = st.container()
         
         # Render messages container
-        messages_container = st.container()
-        with messages_container:
-            messages = st.session_state.chats[st.session_state.current_chat]['messages']
-            for message in messages:
-                # Determina l'avatar e la classe in base al ruolo
-                if message["role"] == "assistant":
-                    avatar = "👲🏿"
-                    css_class = "assistant-message"
-                else:
-                    avatar = "🫏"
-                    css_class = "user-message"
-                
-                # Renderizza il messaggio con l'avatar personalizzato
-                with st.chat_message(message["role"], avatar=avatar):
-                    # Aggiungi la classe CSS al contenitore del messaggio
-                    st.markdown(f'<div class="{css_class}">', unsafe_allow_html=True)
-                    
-                    # Renderizza il contenuto del messaggio
-                    if isinstance(message["content"], str):
-                        st.markdown(message["content"])
-                    elif isinstance(message["content"], dict) and "image" in message["content"]:
-                        st.image(message["content"]["image"])
-                        st.markdown(message["content"]["text"])
-                    
-                    st.markdown('</div>', unsafe_allow_html=True)     
+        self.messages_container = st.container()
+        with self.messages_container:
+            chat = st.session_state.chats[st.session_state.current_chat]
+            messages = chat['messages']
+            # La finestra è salvata nella chat: ogni chat ha la propria,
+            # segue le rinomine e sparisce con la chat
+            window = chat.get('history_window', self.HISTORY_WINDOW)
+            hidden = len(messages) - window
+            if hidden > 0:
+                # I messaggi più vecchi vengono renderizzati solo su richiesta
+                if st.button(f"⬆️ Mostra {min(hidden, self.HISTORY_WINDOW)} messaggi precedenti",
+                             key="show_older_messages"):
+                    chat['history_window'] = window + self.HISTORY_WINDOW
+                    st.rerun(scope="fragment")
+            for message in messages[max(hidden, 0):]:
+                self._render_message(message)
+        
+        # Quick prompts e input
+        cols = st.columns(4)
+        prompts = self.quick_prompts.get(st.session_state.current_model,
+                                         self.quick_prompts['default'])
+        for i, prompt in enumerate(prompts):
+            if cols[i % 4].button(prompt, key=f"quick_prompt_{i}",
+                                  use_container_width=True):
+                self.process_user_message(prompt)
+        
+        if prompt := st.chat_input("Tu chiedere, io rispondere"):
+            self.process_user_message(prompt)
+        
+        with stats_container:
+            self.render_token_stats()
+
+    def _render_message(self, message: Dict[str, Any]):
+        """Renderizza un singolo messaggio della chat."""
+        avatar = "👲🏿" if message["role"] == "assistant" else "🫏"
+        
+        # Un solo elemento markdown per messaggio: ogni st.markdown è un
+        # elemento separato, quindi un <div> aperto e chiuso in due chiamate
+        # diverse non racchiuderebbe comunque il contenuto
+        with st.chat_message(message["role"], avatar=avatar):
+            if isinstance(message["content"], str):
+                st.markdown(message["content"])
+            elif isinstance(message["content"], dict) and "image" in message["content"]:
+                st.image(message["content"]["image"])
+                st.markdown(message["content"]["text"])
 
 class CodeViewer:
     """Componente per la visualizzazione del codice."""
     
+    # Righe mostrate per finestra nei file lunghi
+    WINDOW_LINES = 200
+    
     def __init__(self):
-        self.session = SessionManager()
+        self.session = _session_manager()
+
+    @staticmethod
+    def _line_offsets(file_info: Dict[str, Any], content: str) -> array:
+        """
+        Restituisce gli offset di inizio riga del file, calcolati una sola volta.
+        
+        Args:
+            file_info: Metadati del file, dove vengono memorizzati gli offset
+            content: Contenuto del file
+            
+        Returns:
+            array: Offset del primo carattere di ogni riga
+        """
+        offsets = file_info.get('line_offsets')
+        if offsets is None:
+            offsets = array('L', [0])
+            pos = content.find('\n')
+            while pos != -1 and pos + 1 < len(content):
+                offsets.append(pos + 1)
+                pos = content.find('\n', pos + 1)
+            file_info['line_offsets'] = offsets
+        return offsets
 
     def render(self):
         """Renderizza il componente."""
         selected_file = st.session_state.get('selected_file')
         if selected_file and (file_info := st.session_state.uploaded_files.get(selected_file)):
-            st.markdown(f"**{file_info['name']}** ({file_info['language']})")
-            st.code(file_info['content'], language=file_info['language'])
+            if file_info.get('binary'):
+                st.info(f"{file_info['name']} è un file binario: contenuto non visualizzabile")
+                return
+            content = FileManager.get_content(file_info)
+            line_count = FileManager.get_line_count(file_info)
+            st.markdown(f"**{file_info['name']}** ({file_info['language']}, {line_count} righe)")
+            
+            # Per i file lunghi invia al browser solo una finestra di righe
+            if line_count > self.WINDOW_LINES:
+                start = st.number_input(
+                    "Riga iniziale",
+                    min_value=1,
+                    max_value=line_count,
+                    value=1,
+                    step=self.WINDOW_LINES,
+                    key=f"code_window_{selected_file}"
+                )
+                offsets = self._line_offsets(file_info, content)
+                first = int(start) - 1
+                last = first + self.WINDOW_LINES
+                end = offsets[last] if last < len(offsets) else len(content)
+                content = content[offsets[first]:end]
+                st.caption(f"Righe {first + 1}-{min(last, line_count)} di {line_count}")
+            
+            st.code(content, language=file_info['language'])
         else:
             st.info("Select a file from the sidebar to view its content")
 
+# Modelli raggruppati per provider
+_MODELS = {
+    "OpenAI": {
+        'o1-mini-2024-09-12': '🚀 o1 Mini (Fast)',
+        'o1-preview-2024-09-12': '🔍 o1 Preview (Advanced)',
+        'gpt-4o': '🧠 GPT-4o (Powerful)',
+        'gpt-4o-mini': '⚡ GPT-4o Mini (Efficient)',
+    },
+    "Anthropic": {
+        'claude-3-5-sonnet-20241022': '🎭 Claude 3.5 Sonnet (Detailed)',
+    },
+    "X.AI": {
+        'grok-beta': '🤖 Grok Beta (Smart)',
+        'grok-vision-beta': '👁️ Grok Vision (Image Analysis)'
+    }
+}
+
+def _build_model_options() -> Tuple[List[str], Dict[str, str]]:
+    """
+    Prepara le opzioni del selectbox dei modelli, con gli header dei provider.
+    
+    Returns:
+        Tuple[List[str], Dict[str, str]]: Opzioni ordinate e mappa opzione -> etichetta
+    """
+    options = []
+    labels = {}
+    for provider, provider_models in _MODELS.items():
+        # Aggiungi l'header del provider
+        group_header = f"── {provider} ──"
+        options.append(group_header)
+        labels[group_header] = group_header
+        
+        # Aggiungi i modelli di questo provider
+        for model_id, model_label in provider_models.items():
+            options.append(model_id)
+            labels[model_id] = model_label
+    return options, labels
+
+# Calcolate una sola volta all'import invece che a ogni render
+_MODEL_OPTIONS, _MODEL_LABELS = _build_model_options()
+_MODEL_INDEX = {option: i for i, option in enumerate(_MODEL_OPTIONS)}
+
 class ModelSelector:
     """Componente per la selezione del modello LLM."""
     
     def __init__(self):
-        self.session = SessionManager()
+        self.session = _session_manager()
     
     def render(self):
         """Renderizza il componente."""
-        # Modelli raggruppati per provider
-        models = {
-            "OpenAI": {
-                'o1-mini-2024-09-12': '🚀 o1 Mini (Fast)',
-                'o1-preview-2024-09-12': '🔍 o1 Preview (Advanced)',
-                'gpt-4o': '🧠 GPT-4o (Powerful)',
-                'gpt-4o-mini': '⚡ GPT-4o Mini (Efficient)',
-            },
-            "Anthropic": {
-                'claude-3-5-sonnet-20241022': '🎭 Claude 3.5 Sonnet (Detailed)',
-            },
-            "X.AI": {
-                'grok-beta': '🤖 Grok Beta (Smart)',
-                'grok-vision-beta': '👁️ Grok Vision (Image Analysis)'
-            }
-        }
-
         # Ottieni il modello corrente
         current_model = self.session.get_current_model()
 
-        # Prepara le opzioni con i gruppi
-        all_options = []
-        display_map = {}
-        
-        for provider, provider_models in models.items():
-            # Aggiungi l'header del provider
-            group_header = f"── {provider} ──"
-            all_options.append(group_header)
-            display_map[group_header] = group_header
-            
-            # Aggiungi i modelli di questo provider
-            for model_id, model_label in provider_models.items():
-                all_options.append(model_id)
-                display_map[model_id] = model_label
-
-        # Trova l'indice corrente
-        try:
-            current_index = all_options.index(current_model)
-        except ValueError:
-            current_index = all_options.index('o1-mini-2024-09-12')  # default
+        # Trova l'indice corrente (default: o1-mini)
+        current_index = _MODEL_INDEX.get(current_model, _MODEL_INDEX['o1-mini-2024-09-12'])
 
         # Crea il selectbox
         selected = st.selectbox(
             "Select Model",
-            options=all_options,
-            format_func=lambda x: display_map[x],
+            options=_MODEL_OPTIONS,
+            format_func=_MODEL_LABELS.__getitem__,
             index=current_index,
             label_visibility="collapsed"
         )
 
-        # Aggiorna il modello solo se è stata fatta una selezione valida
+        # Aggiorna il modello solo se è stata fatta una selezione valida.
+        # Nessun rerun: chat e quick prompts leggono current_model più avanti
+        # nello stesso run, quindi vedono già il nuovo valore
         if selected and not selected.startswith('──'):
             if selected != current_model:
                 self.session.set_current_model(selected)
-                st.rerun()
 
         # Info con stile corretto per Streamlit
         info_text = None
@@ -653,7 +877,7 @@ class StatsDisplay:
     """Componente per la visualizzazione delle statistiche."""
     
     def __init__(self):
-        self.session = SessionManager()
+        self.session = _session_manager()
     
     def render(self):
         """Renderizza il componente."""
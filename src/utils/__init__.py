@@ -1,4 +1,4 @@
 from .config import load_config
-from .helpers import truncate_text, calculate_tokens, sanitize_input
+from .helpers import BoundedSet, truncate_text, calculate_tokens, count_lines, sanitize_input
 
-__all__ = ['load_config', 'truncate_text', 'calculate_tokens', 'sanitize_input']
\ No newline at end of file
+__all__ = ['load_config', 'BoundedSet', 'truncate_text', 'calculate_tokens', 'count_lines', 'sanitize_input']
\ No newline at end of file
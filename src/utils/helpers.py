@@ -4,6 +4,7 @@ Utility functions for Allegro IO Code Assistant.
 
 import re
 import html
+from collections import deque
 from typing import List, Dict, Any, Optional
 import streamlit as st
 
@@ -35,6 +36,22 @@ def calculate_tokens(text: str) -> int:
     """
     return len(text) // 4
 
+def count_lines(text: str) -> int:
+    """
+    Conta le righe di un testo terminate da newline, come splitlines()
+    per il testo sorgente. Usa un solo str.count invece di costruire
+    la lista delle righe.
+    
+    Args:
+        text: Testo da analizzare
+        
+    Returns:
+        int: Numero di righe
+    """
+    if not text:
+        return 0
+    return text.count('\n') + (0 if text.endswith('\n') else 1)
+
 def sanitize_input(text: str) -> str:
     """
     Sanitizza l'input dell'utente.
@@ -104,4 +121,32 @@ def analyze_code_complexity(content: str) -> Dict[str, Any]:
         'functions': len(re.findall(r'def\s+\w+\s*\(', content)),
         'classes': len(re.findall(r'class\s+\w+[:\(]', content)),
         'comments': len([l for l in lines if l.strip().startswith('#')])
-    }
\ No newline at end of file
+    }
+
+class BoundedSet:
+    """
+    Set con capacità massima: oltre il limite scarta gli elementi più vecchi.
+    
+    Usato per lo stato di sessione che altrimenti crescerebbe senza limiti
+    nelle sessioni lunghe; l'appartenenza resta O(1).
+    """
+    
+    def __init__(self, maxlen: int = 256):
+        self._order = deque()
+        self._items = set()
+        self.maxlen = maxlen
+    
+    def add(self, item: Any):
+        """Aggiunge un elemento, scartando il più vecchio se pieno."""
+        if item in self._items:
+            return
+        if len(self._order) >= self.maxlen:
+            self._items.discard(self._order.popleft())
+        self._order.append(item)
+        self._items.add(item)
+    
+    def __contains__(self, item: Any) -> bool:
+        return item in self._items
+    
+    def __len__(self) -> int:
+        return len(self._items)
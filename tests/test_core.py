@@ -2,9 +2,13 @@
 Test suite for core functionality of Allegro IO Code Assistant.
 """
 
+import pytest
+import streamlit as st
+from unittest.mock import patch, mock_open, MagicMock
+
 from src.core.session import SessionManager
 from src.core.llm import LLMManager
-from src.core.files import FileManager
+from src.core.files import FileManager, _get_lexer
 
 # Setup per i test che usano st.session_state
 @pytest.fixture(autouse=True)
@@ -147,4 +151,127 @@ class TestFileManager:
         code = "print('test')"
         highlighted = file_manager.highlight_code(code, "python")
         assert 'class="source"' in highlighted
-        assert 'print' in highlighted
\ No newline at end of file
+        assert 'print' in highlighted
+    
+    @pytest.mark.parametrize("language, lexer_name", [
+        ("py", "Python"),
+        ("python", "Python"),
+        ("js", "JavaScript"),
+        ("tsx", "TSX"),
+        ("md", "Markdown"),
+        ("yml", "YAML"),
+        ("txt", "Text only"),
+        ("sconosciuto", "Text only"),
+    ])
+    def test_lexer_resolution(self, language, lexer_name):
+        """Test risoluzione del lexer da estensioni e nomi prodotti dall'app."""
+        assert _get_lexer(language).name == lexer_name
+    
+    def test_lazy_zip_content(self, file_manager):
+        """Test lettura on demand del contenuto di un file estratto da ZIP."""
+        import io
+        import zipfile
+        
+        zip_buffer = io.BytesIO()
+        with zipfile.ZipFile(zip_buffer, 'w') as zip_file:
+            zip_file.writestr('test.py', "print('test')")
+        
+        st.session_state.zip_archives = {'zip-id': zipfile.ZipFile(zip_buffer)}
+        file_info = {'name': 'test.py', 'language': 'py', 'archive': 'zip-id'}
+        
+        assert 'content' not in file_info
+        assert file_manager.get_content(file_info) == "print('test')"
+    
+    def test_unreadable_zip_entry(self, file_manager):
+        """Test entry ZIP illeggibile restituita come contenuto vuoto."""
+        import io
+        import zipfile
+        
+        zip_buffer = io.BytesIO()
+        with zipfile.ZipFile(zip_buffer, 'w') as zip_file:
+            zip_file.writestr('test.py', "print('test')")
+        
+        st.session_state.zip_archives = {'zip-id': zipfile.ZipFile(zip_buffer)}
+        file_info = {'name': 'missing.py', 'language': 'py', 'archive': 'zip-id'}
+        
+        assert file_manager.get_content(file_info) == ""
+    
+    def test_lazy_raw_content(self, file_manager):
+        """Test decodifica al primo accesso dei file caricati singolarmente."""
+        file_info = {'name': 'test.py', 'language': 'py', 'raw': b"print('test')"}
+        
+        assert file_manager.get_content(file_info) == "print('test')"
+        assert 'raw' not in file_info
+        assert file_info['content'] == "print('test')"
+    
+    def test_line_count_cached(self, file_manager):
+        """Test conteggio righe al primo accesso, poi salvato nei metadati."""
+        file_info = {'name': 'test.py', 'language': 'py', 'raw': b"a = 1\nb = 2\n"}
+        
+        assert file_manager.get_line_count(file_info) == 2
+        assert file_info['line_count'] == 2
+    
+    def test_binary_content_skipped(self, file_manager):
+        """Test file binari restituiti come contenuto vuoto."""
+        file_info = {'name': 'image.txt', 'language': 'txt', 'raw': b"\x89PNG\x00\x00"}
+        
+        assert file_manager.get_content(file_info) == ""
+    
+    def test_is_binary(self, file_manager):
+        """Test riconoscimento dei file binari dai primi byte."""
+        assert file_manager.is_binary(b"\x89PNG\x00\x00")
+        assert not file_manager.is_binary(b"print('test')")
+    
+    def test_invalid_utf8_replaced(self, file_manager):
+        """Test byte non UTF-8 sostituiti invece di far fallire la decodifica."""
+        file_info = {'name': 'test.py', 'language': 'py', 'raw': b"x = '\xff'"}
+        
+        assert file_manager.get_content(file_info) == "x = '\ufffd'"
+
+class TestChatContext:
+    """Test per la cache incrementale del contesto chat."""
+    
+    @pytest.fixture
+    def chat(self):
+        """ChatInterface senza inizializzazione: _get_context usa solo session_state."""
+        from src.ui.components import ChatInterface
+        st.session_state.context_cache = None
+        st.session_state.uploaded_files = {
+            'a.py': {'name': 'a.py', 'language': 'py', 'content': "a = 1"}
+        }
+        st.session_state.uploaded_files_version = 1
+        return ChatInterface.__new__(ChatInterface)
+    
+    def test_unchanged_version_reuses_cache(self, chat):
+        """Test stessa versione: il testo in cache viene restituito senza ricostruirlo."""
+        context = chat._get_context()
+        with patch('src.ui.components.FileManager.get_content') as get_content:
+            assert chat._get_context() is context
+            get_content.assert_not_called()
+    
+    def test_appended_file_extends_cache(self, chat):
+        """Test nuovo file: viene formattato solo il blocco aggiunto."""
+        context = chat._get_context()
+        st.session_state.uploaded_files['b.py'] = {'name': 'b.py', 'language': 'py', 'content': "b = 2"}
+        st.session_state.uploaded_files_version += 1
+        
+        with patch('src.ui.components.FileManager.get_content', return_value="b = 2") as get_content:
+            extended = chat._get_context()
+            get_content.assert_called_once()
+        assert extended.startswith(context)
+        assert "File: b.py" in extended
+    
+    def test_removed_or_replaced_file_rebuilds(self, chat):
+        """Test file rimosso o sostituito: il contesto viene ricostruito."""
+        chat._get_context()
+        st.session_state.uploaded_files['a.py'] = {'name': 'a.py', 'language': 'py', 'content': "a = 2"}
+        st.session_state.uploaded_files_version += 1
+        assert "a = 2" in chat._get_context()
+        assert "a = 1" not in chat._get_context()
+        
+        del st.session_state.uploaded_files['a.py']
+        st.session_state.uploaded_files['c.py'] = {'name': 'c.py', 'language': 'py', 'content': "c = 3"}
+        st.session_state.uploaded_files_version += 1
+        context = chat._get_context()
+        assert "File: a.py" not in context
+        assert "File: c.py" in context
@@ -4,7 +4,7 @@ Test suite for utility functions of Allegro IO Code Assistant.
 
 import pytest
 from src.utils.config import load_config
-from src.utils.helpers import truncate_text, calculate_tokens, sanitize_input
+from src.utils.helpers import BoundedSet, truncate_text, calculate_tokens, count_lines, sanitize_input
 
 class TestConfig:
     """Test per le funzionalità di configurazione."""
@@ -35,6 +35,20 @@ class TestHelpers:
         assert truncate_text(text, 20) == text
         assert truncate_text("", 5) == ""
     
+    def test_count_lines(self):
+        """Test conteggio righe coerente con splitlines."""
+        for text in ["", "a", "a\n", "a\nb", "a\nb\n", "\n\n"]:
+            assert count_lines(text) == len(text.splitlines())
+    
+    def test_bounded_set(self):
+        """Test set limitato che scarta gli elementi più vecchi."""
+        items = BoundedSet(maxlen=2)
+        for item in (1, 2, 2, 3):
+            items.add(item)
+        assert len(items) == 2
+        assert 1 not in items
+        assert 2 in items and 3 in items
+    
     def test_sanitize_input(self):
         """Test sanitizzazione input."""
         test_cases = [